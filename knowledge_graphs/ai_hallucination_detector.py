@@ -63,7 +63,7 @@ class AIHallucinationDetector:
         Returns:
             Complete validation report as dictionary
         """
-        logger.info(f"Starting hallucination detection for: {script_path}")
+        logger.info("Starting hallucination detection for: %s", script_path)
         
         # Validate input
         if not os.path.exists(script_path):
@@ -84,19 +84,21 @@ class AIHallucinationDetector:
             analysis_result = self.analyzer.analyze_script(script_path)
             
             if analysis_result.errors:
-                logger.warning(f"Analysis warnings: {analysis_result.errors}")
+                logger.warning("Analysis warnings: %s", analysis_result.errors)
             
-            logger.info(f"Found: {len(analysis_result.imports)} imports, "
-                       f"{len(analysis_result.class_instantiations)} class instantiations, "
-                       f"{len(analysis_result.method_calls)} method calls, "
-                       f"{len(analysis_result.function_calls)} function calls, "
-                       f"{len(analysis_result.attribute_accesses)} attribute accesses")
+            logger.info("Found: %d imports, %d class instantiations, %d method calls, "
+                        "%d function calls, %d attribute accesses",
+                        len(analysis_result.imports),
+                        len(analysis_result.class_instantiations),
+                        len(analysis_result.method_calls),
+                        len(analysis_result.function_calls),
+                        len(analysis_result.attribute_accesses))
             
             # Step 2: Validate against knowledge graph
             logger.info("Step 2: Validating against knowledge graph...")
             validation_result = await self.validator.validate_script(analysis_result)
             
-            logger.info(f"Validation complete. Overall confidence: {validation_result.overall_confidence:.1%}")
+            logger.info("Validation complete. Overall confidence: %.1f%%", validation_result.overall_confidence * 100)
             
             # Step 3: Generate comprehensive report
             logger.info("Step 3: Generating reports...")
@@ -121,7 +123,7 @@ class AIHallucinationDetector:
             return report
             
         except Exception as e:
-            logger.error(f"Error during hallucination detection: {str(e)}")
+            logger.error("Error during hallucination detection: %s", e)
             raise
     
     async def batch_detect(self, script_paths: List[str], 
@@ -136,11 +138,11 @@ class AIHallucinationDetector:
         Returns:
             List of validation reports
         """
-        logger.info(f"Starting batch detection for {len(script_paths)} scripts")
+        logger.info("Starting batch detection for %d scripts", len(script_paths))
         
         results = []
         for i, script_path in enumerate(script_paths, 1):
-            logger.info(f"Processing script {i}/{len(script_paths)}: {script_path}")
+            logger.info("Processing script %d/%d: %s", i, len(script_paths), script_path)
             
             try:
                 result = await self.detect_hallucinations(
@@ -151,7 +153,7 @@ class AIHallucinationDetector:
                 results.append(result)
                 
             except Exception as e:
-                logger.error(f"Failed to process {script_path}: {str(e)}")
+                logger.error("Failed to process %s: %s", script_path, e)
                 # Continue with other scripts
                 continue
         
@@ -324,7 +326,7 @@ Examples:
         sys.exit(1)
     
     except Exception as e:
-        logger.error(f"Detection failed: {str(e)}")
+        logger.error("Detection failed: %s", e)
         sys.exit(1)
     
     finally:
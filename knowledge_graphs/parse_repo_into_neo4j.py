@@ -181,7 +181,7 @@ class Neo4jCodeAnalyzer:
             }
             
         except Exception as e:
-            logger.warning(f"Could not analyze {file_path}: {e}")
+            logger.warning("Could not analyze %s: %s", file_path, e)
             return None
     
     def _is_likely_internal(self, import_name: str, project_modules: Set[str]) -> bool:
@@ -436,7 +436,7 @@ class DirectNeo4jExtractor:
     
     async def clear_repository_data(self, repo_name: str):
         """Clear all data for a specific repository"""
-        logger.info(f"Clearing existing data for repository: {repo_name}")
+        logger.info("Clearing existing data for repository: %s", repo_name)
         async with self.driver.session() as session:
             # Delete in specific order to avoid constraint issues
             
@@ -475,7 +475,7 @@ class DirectNeo4jExtractor:
                 DETACH DELETE r
             """, repo_name=repo_name)
             
-        logger.info(f"Cleared data for repository: {repo_name}")
+        logger.info("Cleared data for repository: %s", repo_name)
     
     async def close(self):
         """Close Neo4j connection"""
@@ -484,9 +484,9 @@ class DirectNeo4jExtractor:
     
     def clone_repo(self, repo_url: str, target_dir: str) -> str:
         """Clone repository with shallow clone"""
-        logger.info(f"Cloning repository to: {target_dir}")
+        logger.info("Cloning repository to: %s", target_dir)
         if os.path.exists(target_dir):
-            logger.info(f"Removing existing directory: {target_dir}")
+            logger.info("Removing existing directory: %s", target_dir)
             try:
                 def handle_remove_readonly(func, path, exc):
                     try:
@@ -494,13 +494,13 @@ class DirectNeo4jExtractor:
                             os.chmod(path, 0o777)
                             func(path)
                     except PermissionError:
-                        logger.warning(f"Could not remove {path} - file in use, skipping")
+                        logger.warning("Could not remove %s - file in use, skipping", path)
                         pass
                 shutil.rmtree(target_dir, onerror=handle_remove_readonly)
             except Exception as e:
-                logger.warning(f"Could not fully remove {target_dir}: {e}. Proceeding anyway...")
+                logger.warning("Could not fully remove %s: %s. Proceeding anyway...", target_dir, e)
         
-        logger.info(f"Running git clone from {repo_url}")
+        logger.info("Running git clone from %s", repo_url)
         subprocess.run(['git', 'clone', '--depth', '1', repo_url, target_dir], check=True)
         logger.info("Repository cloned successfully")
         return target_dir
@@ -529,7 +529,7 @@ class DirectNeo4jExtractor:
     async def analyze_repository(self, repo_url: str, temp_dir: str = None):
         """Analyze repository and create nodes/relationships in Neo4j"""
         repo_name = repo_url.split('/')[-1].replace('.git', '')
-        logger.info(f"Analyzing repository: {repo_name}")
+        logger.info("Analyzing repository: %s", repo_name)
         
         # Clear existing data for this repository before re-processing
         await self.clear_repository_data(repo_name)
@@ -539,37 +539,14 @@ class DirectNeo4jExtractor:
             script_dir = Path(__file__).parent
             temp_dir = str(script_dir / "repos" / repo_name)
         
-        # Clone and analyze
-        repo_path = Path(self.clone_repo(repo_url, temp_dir))
+        # Clone and analyze. Cloning and parsing are blocking, so they run in a worker
+        # thread to keep the event loop (and the MCP server on it) responsive.
+        repo_path = Path(await asyncio.to_thread(self.clone_repo, repo_url, temp_dir))
         
         try:
-            logger.info("Getting Python files...")
-            python_files = self.get_python_files(str(repo_path))
-            logger.info(f"Found {len(python_files)} Python files to analyze")
+            modules_data = await asyncio.to_thread(self._analyze_python_files, repo_path)
             
-            # First pass: identify project modules
-            logger.info("Identifying project modules...")
-            project_modules = set()
-            for file_path in python_files:
-                relative_path = str(file_path.relative_to(repo_path))
-                module_parts = relative_path.replace('/', '.').replace('.py', '').split('.')
-                if len(module_parts) > 0 and not module_parts[0].startswith('.'):
-                    project_modules.add(module_parts[0])
-            
-            logger.info(f"Identified project modules: {sorted(project_modules)}")
-            
-            # Second pass: analyze files and collect data
-            logger.info("Analyzing Python files...")
-            modules_data = []
-            for i, file_path in enumerate(python_files):
-                if i % 20 == 0:
-                    logger.info(f"Analyzing file {i+1}/{len(python_files)}: {file_path.name}")
-                
-                analysis = self.analyzer.analyze_python_file(file_path, repo_path, project_modules)
-                if analysis:
-                    modules_data.append(analysis)
-            
-            logger.info(f"Found {len(modules_data)} files with content")
+            logger.info("Found %d files with content", len(modules_data))
             
             # Create nodes and relationships in Neo4j
             logger.info("Creating nodes and relationships in Neo4j...")
@@ -588,26 +565,60 @@ class DirectNeo4jExtractor:
             print(f"Functions created: {total_functions}")
             print(f"Import relationships: {total_imports}")
             
-            logger.info(f"Successfully created Neo4j graph for {repo_name}")
+            logger.info("Successfully created Neo4j graph for %s", repo_name)
             
         finally:
-            if os.path.exists(temp_dir):
-                logger.info(f"Cleaning up temporary directory: {temp_dir}")
-                try:
-                    def handle_remove_readonly(func, path, exc):
-                        try:
-                            if os.path.exists(path):
-                                os.chmod(path, 0o777)
-                                func(path)
-                        except PermissionError:
-                            logger.warning(f"Could not remove {path} - file in use, skipping")
-                            pass
-                    
-                    shutil.rmtree(temp_dir, onerror=handle_remove_readonly)
-                    logger.info("Cleanup completed")
-                except Exception as e:
-                    logger.warning(f"Cleanup failed: {e}. Directory may remain at {temp_dir}")
-                    # Don't fail the whole process due to cleanup issues
+            await asyncio.to_thread(self._cleanup_temp_dir, temp_dir)
+    
+    def _analyze_python_files(self, repo_path: Path) -> List[Dict]:
+        """Find and parse the repository's Python files, returning the per-module analysis"""
+        logger.info("Getting Python files...")
+        python_files = self.get_python_files(str(repo_path))
+        logger.info("Found %d Python files to analyze", len(python_files))
+        
+        # First pass: identify project modules
+        logger.info("Identifying project modules...")
+        project_modules = set()
+        for file_path in python_files:
+            relative_path = str(file_path.relative_to(repo_path))
+            module_parts = relative_path.replace('/', '.').replace('.py', '').split('.')
+            if len(module_parts) > 0 and not module_parts[0].startswith('.'):
+                project_modules.add(module_parts[0])
+        
+        logger.info("Identified project modules: %s", sorted(project_modules))
+        
+        # Second pass: analyze files and collect data
+        logger.info("Analyzing Python files...")
+        modules_data = []
+        for i, file_path in enumerate(python_files):
+            if i % 20 == 0:
+                logger.info("Analyzing file %d/%d: %s", i+1, len(python_files), file_path.name)
+            
+            analysis = self.analyzer.analyze_python_file(file_path, repo_path, project_modules)
+            if analysis:
+                modules_data.append(analysis)
+        
+        return modules_data
+    
+    def _cleanup_temp_dir(self, temp_dir: str):
+        """Remove the cloned repository directory"""
+        if os.path.exists(temp_dir):
+            logger.info("Cleaning up temporary directory: %s", temp_dir)
+            try:
+                def handle_remove_readonly(func, path, exc):
+                    try:
+                        if os.path.exists(path):
+                            os.chmod(path, 0o777)
+                            func(path)
+                    except PermissionError:
+                        logger.warning("Could not remove %s - file in use, skipping", path)
+                        pass
+                
+                shutil.rmtree(temp_dir, onerror=handle_remove_readonly)
+                logger.info("Cleanup completed")
+            except Exception as e:
+                logger.warning("Cleanup failed: %s. Directory may remain at %s", e, temp_dir)
+                # Don't fail the whole process due to cleanup issues
     
     async def _create_graph(self, repo_name: str, modules_data: List[Dict]):
         """Create all nodes and relationships in Neo4j"""
@@ -777,9 +788,9 @@ class DirectNeo4jExtractor:
                     relationships_created += 1
                 
                 if (i + 1) % 10 == 0:
-                    logger.info(f"Processed {i + 1}/{len(modules_data)} files...")
+                    logger.info("Processed %d/%d files...", i + 1, len(modules_data))
             
-            logger.info(f"Created {nodes_created} nodes and {relationships_created} relationships")
+            logger.info("Created %d nodes and %d relationships", nodes_created, relationships_created)
     
     async def search_graph(self, query_type: str, **kwargs):
         """Search the Neo4j graph directly"""
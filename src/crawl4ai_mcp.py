@@ -6,11 +6,10 @@ the appropriate crawl method based on URL type (sitemap, txt file, or regular we
 Also includes AI hallucination detection and repository parsing tools using Neo4j knowledge graphs.
 """
 from mcp.server.fastmcp import FastMCP, Context
-from sentence_transformers import CrossEncoder
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 from urllib.parse import urlparse, urldefrag
 from xml.etree import ElementTree
 from dotenv import load_dotenv
@@ -18,14 +17,22 @@ from supabase import Client
 from pathlib import Path
 import requests
 import asyncio
+import atexit
 import json
+import logging
+import logging.handlers
 import os
+import queue
 import re
 import concurrent.futures
 import sys
 
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, MemoryAdaptiveDispatcher
 
+if TYPE_CHECKING:
+    # sentence_transformers pulls in torch, so it is only imported when reranking is enabled
+    from sentence_transformers import CrossEncoder
+
 # Add knowledge_graphs folder to path for importing knowledge graph modules
 knowledge_graphs_path = Path(__file__).resolve().parent.parent / 'knowledge_graphs'
 sys.path.append(str(knowledge_graphs_path))
@@ -39,7 +46,8 @@ from utils import (
     add_code_examples_to_supabase,
     update_source_info,
     extract_source_summary,
-    search_code_examples
+    search_code_examples,
+    reload_config
 )
 
 # Import knowledge graph modules
@@ -55,6 +63,30 @@ dotenv_path = project_root / '.env'
 # Force override of existing environment variables
 load_dotenv(dotenv_path, override=True)
 
+# utils was imported before the .env file was loaded, so refresh its cached settings
+reload_config()
+
+def setup_queue_logging() -> None:
+    """
+    Route log records through a queue so worker threads only enqueue them and a single
+    background listener thread writes them out with the root logger's handlers.
+    """
+    root = logging.getLogger()
+    if any(isinstance(handler, logging.handlers.QueueHandler) for handler in root.handlers):
+        return
+    
+    handlers = root.handlers[:] or [logging.StreamHandler()]
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+setup_queue_logging()
+
 # Helper functions for Neo4j validation and error handling
 def validate_neo4j_connection() -> bool:
     """Check if Neo4j environment variables are configured."""
@@ -118,7 +150,7 @@ class Crawl4AIContext:
     """Context for the Crawl4AI MCP server."""
     crawler: AsyncWebCrawler
     supabase_client: Client
-    reranking_model: Optional[CrossEncoder] = None
+    reranking_model: Optional["CrossEncoder"] = None
     knowledge_validator: Optional[Any] = None  # KnowledgeGraphValidator when available
     repo_extractor: Optional[Any] = None       # DirectNeo4jExtractor when available
 
@@ -150,6 +182,7 @@ async def crawl4ai_lifespan(server: FastMCP) -> AsyncIterator[Crawl4AIContext]:
     reranking_model = None
     if os.getenv("USE_RERANKING", "false") == "true":
         try:
+            from sentence_transformers import CrossEncoder
             reranking_model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
         except Exception as e:
             print(f"Failed to load reranking model: {e}")
@@ -223,7 +256,7 @@ mcp = FastMCP(
     port=os.getenv("PORT", "8051")
 )
 
-def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
+def rerank_results(model: "CrossEncoder", query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
     """
     Rerank search results using a cross-encoder model.
     
@@ -446,11 +479,11 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
             url_to_full_document = {url: result.markdown}
             
             # Update source information FIRST (before inserting documents)
-            source_summary = extract_source_summary(source_id, result.markdown[:5000])  # Use first 5000 chars for summary
-            update_source_info(supabase_client, source_id, source_summary, total_word_count)
+            source_summary = await asyncio.to_thread(extract_source_summary, source_id, result.markdown[:5000])  # Use first 5000 chars for summary
+            await asyncio.to_thread(update_source_info, supabase_client, source_id, source_summary, total_word_count)
             
             # Add documentation chunks to Supabase (AFTER source exists)
-            add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
+            await asyncio.to_thread(add_documents_to_supabase, supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
             
             # Extract and process code examples only if enabled
             extract_code_examples = os.getenv("USE_AGENTIC_RAG", "false") == "true"
@@ -470,7 +503,7 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
                                         for block in code_blocks]
                         
                         # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
+                        summaries = await asyncio.to_thread(lambda: list(executor.map(process_code_example, summary_args)))
                     
                     # Prepare code example data
                     for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
@@ -490,7 +523,8 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
                         code_metadatas.append(code_meta)
                     
                     # Add code examples to Supabase
-                    add_code_examples_to_supabase(
+                    await asyncio.to_thread(
+                        add_code_examples_to_supabase,
                         supabase_client, 
                         code_urls, 
                         code_chunk_numbers, 
@@ -562,7 +596,7 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
             crawl_type = "text_file"
         elif is_sitemap(url):
             # For sitemaps, extract URLs and crawl in parallel
-            sitemap_urls = parse_sitemap(url)
+            sitemap_urls = await asyncio.to_thread(parse_sitemap, url)
             if not sitemap_urls:
                 return json.dumps({
                     "success": False,
@@ -636,15 +670,15 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
         # Update source information for each unique source FIRST (before inserting documents)
         with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
             source_summary_args = [(source_id, content) for source_id, content in source_content_map.items()]
-            source_summaries = list(executor.map(lambda args: extract_source_summary(args[0], args[1]), source_summary_args))
+            source_summaries = await asyncio.to_thread(lambda: list(executor.map(lambda args: extract_source_summary(args[0], args[1]), source_summary_args)))
         
         for (source_id, _), summary in zip(source_summary_args, source_summaries):
             word_count = source_word_counts.get(source_id, 0)
-            update_source_info(supabase_client, source_id, summary, word_count)
+            await asyncio.to_thread(update_source_info, supabase_client, source_id, summary, word_count)
         
         # Add documentation chunks to Supabase (AFTER sources exist)
         batch_size = 20
-        add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, batch_size=batch_size)
+        await asyncio.to_thread(add_documents_to_supabase, supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, batch_size=batch_size)
         
         # Extract and process code examples from all documents only if enabled
         extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
@@ -661,40 +695,42 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
                 source_url = doc['url']
                 md = doc['markdown']
                 code_blocks = extract_code_blocks(md)
-                
-                if code_blocks:
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
+                all_code_blocks.extend((source_url, block) for block in code_blocks)
+            
+            if all_code_blocks:
+                # Summarize the code examples of every document in one parallel pass
+                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+                    # Prepare arguments for parallel processing
+                    summary_args = [(block['code'], block['context_before'], block['context_after']) 
+                                    for _, block in all_code_blocks]
                     
-                    # Prepare code example data
+                    # Generate summaries in parallel
+                    summaries = await asyncio.to_thread(lambda: list(executor.map(process_code_example, summary_args)))
+                
+                # Prepare code example data
+                for (source_url, block), summary in zip(all_code_blocks, summaries):
                     parsed_url = urlparse(source_url)
                     source_id = parsed_url.netloc or parsed_url.path
                     
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(source_url)
-                        code_chunk_numbers.append(len(code_examples))  # Use global code example index
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": len(code_examples) - 1,
-                            "url": source_url,
-                            "source": source_id,
-                            "char_count": len(block['code']),
-                            "word_count": len(block['code'].split())
-                        }
-                        code_metadatas.append(code_meta)
+                    code_urls.append(source_url)
+                    code_chunk_numbers.append(len(code_examples))  # Use global code example index
+                    code_examples.append(block['code'])
+                    code_summaries.append(summary)
+                    
+                    # Create metadata for code example
+                    code_meta = {
+                        "chunk_index": len(code_examples) - 1,
+                        "url": source_url,
+                        "source": source_id,
+                        "char_count": len(block['code']),
+                        "word_count": len(block['code'].split())
+                    }
+                    code_metadatas.append(code_meta)
             
             # Add all code examples to Supabase
             if code_examples:
-                add_code_examples_to_supabase(
+                await asyncio.to_thread(
+                    add_code_examples_to_supabase,
                     supabase_client, 
                     code_urls, 
                     code_chunk_numbers, 
@@ -744,10 +780,12 @@ async def get_available_sources(ctx: Context) -> str:
         supabase_client = ctx.request_context.lifespan_context.supabase_client
         
         # Query the sources table directly
-        result = supabase_client.from_('sources')\
-            .select('*')\
-            .order('source_id')\
-            .execute()
+        result = await asyncio.to_thread(
+            supabase_client.from_('sources')
+            .select('*')
+            .order('source_id')
+            .execute
+        )
         
         # Format the sources with their details
         sources = []
@@ -806,7 +844,8 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
             # Hybrid search: combine vector and keyword search
             
             # 1. Get vector search results (get more to account for filtering)
-            vector_results = search_documents(
+            vector_results = await asyncio.to_thread(
+                search_documents,
                 client=supabase_client,
                 query=query,
                 match_count=match_count * 2,  # Get double to have room for filtering
@@ -823,7 +862,7 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
                 keyword_query = keyword_query.eq('source_id', source)
             
             # Execute keyword search
-            keyword_response = keyword_query.limit(match_count * 2).execute()
+            keyword_response = await asyncio.to_thread(keyword_query.limit(match_count * 2).execute)
             keyword_results = keyword_response.data if keyword_response.data else []
             
             # 3. Combine results with preference for items appearing in both
@@ -869,7 +908,8 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
             
         else:
             # Standard vector search only
-            results = search_documents(
+            results = await asyncio.to_thread(
+                search_documents,
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
@@ -879,7 +919,9 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
         # Apply reranking if enabled
         use_reranking = os.getenv("USE_RERANKING", "false") == "true"
         if use_reranking and ctx.request_context.lifespan_context.reranking_model:
-            results = rerank_results(ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content")
+            results = await asyncio.to_thread(
+                rerank_results, ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content"
+            )
         
         # Format the results
         formatted_results = []
@@ -958,7 +1000,8 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
             from utils import search_code_examples as search_code_examples_impl
             
             # 1. Get vector search results (get more to account for filtering)
-            vector_results = search_code_examples_impl(
+            vector_results = await asyncio.to_thread(
+                search_code_examples_impl,
                 client=supabase_client,
                 query=query,
                 match_count=match_count * 2,  # Get double to have room for filtering
@@ -975,7 +1018,7 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
                 keyword_query = keyword_query.eq('source_id', source_id)
             
             # Execute keyword search
-            keyword_response = keyword_query.limit(match_count * 2).execute()
+            keyword_response = await asyncio.to_thread(keyword_query.limit(match_count * 2).execute)
             keyword_results = keyword_response.data if keyword_response.data else []
             
             # 3. Combine results with preference for items appearing in both
@@ -1024,7 +1067,8 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
             # Standard vector search only
             from utils import search_code_examples as search_code_examples_impl
             
-            results = search_code_examples_impl(
+            results = await asyncio.to_thread(
+                search_code_examples_impl,
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
@@ -1034,7 +1078,9 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
         # Apply reranking if enabled
         use_reranking = os.getenv("USE_RERANKING", "false") == "true"
         if use_reranking and ctx.request_context.lifespan_context.reranking_model:
-            results = rerank_results(ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content")
+            results = await asyncio.to_thread(
+                rerank_results, ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content"
+            )
         
         # Format the results
         formatted_results = []
@@ -1118,9 +1164,9 @@ async def check_ai_script_hallucinations(ctx: Context, script_path: str) -> str:
                 "error": validation["error"]
             }, indent=2)
         
-        # Step 1: Analyze script structure using AST
+        # Step 1: Analyze script structure using AST (file reading and parsing block, so run in a thread)
         analyzer = AIScriptAnalyzer()
-        analysis_result = analyzer.analyze_script(script_path)
+        analysis_result = await asyncio.to_thread(analyzer.analyze_script, script_path)
         
         if analysis_result.errors:
             print(f"Analysis warnings for {script_path}: {analysis_result.errors}")
@@ -2,17 +2,249 @@
 Utility functions for the Crawl4AI MCP server.
 """
 import os
+import atexit
 import concurrent.futures
+import functools
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional, Tuple
 import json
+import logging
 from supabase import create_client, Client
 from urllib.parse import urlparse
+import httpx
 import openai
 import re
+import threading
 import time
 
-# Load OpenAI API key for embeddings
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
+
+# Settings read from environment variables. They are read once instead of on every
+# request; reload_config() refreshes them after a .env file has been loaded.
+MODEL_CHOICE: Optional[str] = None
+USE_CONTEXTUAL_EMBEDDINGS = False
+CONTEXTUAL_CACHE_SIZE = 10000
+SUPABASE_INSERT_CONCURRENCY = 4
+# Requests per second per OpenAI endpoint family (0 disables rate limiting)
+OPENAI_REQUESTS_PER_SECOND = 0.0
+# In-flight request limits per OpenAI endpoint family
+MAX_CONCURRENT_REQUESTS: Dict[str, int] = {"chat": 10, "embeddings": 10}
+
+def _positive_int_setting(name: str, default: int) -> int:
+    """
+    Read an integer setting that must be at least 1, such as a worker or concurrency limit.
+    
+    Unset or empty values use the default. Values below 1 would deadlock or break the
+    pools they size, so they are logged and replaced by the default as well.
+    
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is unset, empty or below 1
+        
+    Returns:
+        The configured value
+        
+    Raises:
+        ValueError: If the variable is set to something other than an integer
+    """
+    raw = os.getenv(name) or default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {raw!r}") from None
+    if value < 1:
+        logger.warning("%s must be at least 1, got %d; using %d instead", name, value, default)
+        return default
+    return value
+
+def reload_config() -> None:
+    """
+    Re-read the OpenAI and RAG settings from environment variables.
+    """
+    global MODEL_CHOICE, USE_CONTEXTUAL_EMBEDDINGS, CONTEXTUAL_CACHE_SIZE, SUPABASE_INSERT_CONCURRENCY
+    global OPENAI_REQUESTS_PER_SECOND
+    
+    # Load OpenAI API key for embeddings
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    # Cap each request well below the SDK's 10 minute default so a hung connection is
+    # abandoned and retried instead of stalling a worker thread
+    # Empty values (as left by copying .env.example) fall back to the defaults
+    openai.timeout = float(os.getenv("OPENAI_TIMEOUT") or 60)
+    MODEL_CHOICE = os.getenv("MODEL_CHOICE")
+    USE_CONTEXTUAL_EMBEDDINGS = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
+    CONTEXTUAL_CACHE_SIZE = int(os.getenv("CONTEXTUAL_CACHE_SIZE") or 10000)
+    SUPABASE_INSERT_CONCURRENCY = _positive_int_setting("SUPABASE_INSERT_CONCURRENCY", 4)
+    # Parsed here rather than on the first request, so a malformed value stops the server
+    # at startup instead of failing (and being swallowed) inside every OpenAI call
+    for kind in MAX_CONCURRENT_REQUESTS:
+        MAX_CONCURRENT_REQUESTS[kind] = _positive_int_setting(f"MAX_{kind.upper()}_CONCURRENT", 10)
+    raw_rate = os.getenv("OPENAI_REQUESTS_PER_SECOND") or "0"
+    try:
+        OPENAI_REQUESTS_PER_SECOND = float(raw_rate)
+    except ValueError:
+        raise ValueError(f"OPENAI_REQUESTS_PER_SECOND must be a number, got {raw_rate!r}") from None
+    if not OPENAI_REQUESTS_PER_SECOND >= 0:
+        logger.warning("OPENAI_REQUESTS_PER_SECOND must not be negative, got %s; rate limiting is disabled", raw_rate)
+        OPENAI_REQUESTS_PER_SECOND = 0.0
+    with _api_limits_lock:
+        _request_semaphores.clear()
+        _rate_buckets.clear()
+    
+    # Rebuild the connection pool so its keep-alive setting is re-read. This runs at
+    # startup, before the module-level OpenAI client is first used and captures the pool.
+    close_http_client()
+    get_http_client.cache_clear()
+    openai.http_client = get_http_client()
+    
+    # The embedding client captures the API key, timeout and pool, so rebuild it on next use
+    get_embedding_client.cache_clear()
+
+@functools.lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """
+    Get the keep-alive connection pool shared by every OpenAI client in the process.
+    
+    The pool is sized for the worker threads that generate summaries and embeddings in
+    parallel. Idle connections are dropped after OPENAI_KEEPALIVE_EXPIRY seconds so a
+    request after a quiet period opens a fresh socket instead of reusing one the server
+    may already have closed. The setting is read when the pool is built, which happens
+    in reload_config() after the .env file has been loaded.
+    
+    Returns:
+        The shared httpx client
+    """
+    return openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=50,
+            max_keepalive_connections=20,
+            keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY") or 5)
+        )
+    )
+
+def close_http_client() -> None:
+    """
+    Close the shared connection pool, if one has been built.
+    """
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+
+atexit.register(close_http_client)
+
+@functools.lru_cache(maxsize=1)
+def get_embedding_client() -> openai.OpenAI:
+    """
+    Get the OpenAI client used for embedding requests.
+    
+    SDK-level retries are disabled because create_embeddings_batch already retries
+    with its own backoff; leaving both on multiplies the attempts on a failing request.
+    
+    Returns:
+        OpenAI client sharing the process-wide connection pool
+    """
+    return openai.OpenAI(
+        api_key=openai.api_key,
+        timeout=openai.timeout,
+        max_retries=0,
+        http_client=get_http_client()
+    )
+
+@dataclass
+class TokenBucket:
+    """
+    Thread-safe token bucket used to cap the request rate to an API endpoint.
+    
+    Each call to acquire() reserves one token under the lock and sleeps outside of it,
+    so concurrent workers are spaced out instead of all firing at once.
+    """
+    rate: float
+    capacity: int = 1
+    tokens: float = 1.0
+    last_refill: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    
+    def acquire(self) -> None:
+        """Block until a request is allowed by the bucket."""
+        if self.rate <= 0:
+            return
+        
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        
+        if wait > 0:
+            time.sleep(wait)
+
+# Rate limiters per OpenAI endpoint family ("chat" or "embeddings"), created on first use
+_rate_buckets: Dict[str, TokenBucket] = {}
+_api_limits_lock = threading.Lock()
+
+def get_rate_bucket(kind: str) -> TokenBucket:
+    """
+    Get the token bucket for an OpenAI endpoint family.
+    
+    The rate comes from OPENAI_REQUESTS_PER_SECOND as parsed by reload_config()
+    (0 or unset disables rate limiting).
+    
+    Args:
+        kind: Endpoint family, either "chat" or "embeddings"
+        
+    Returns:
+        The shared TokenBucket for that endpoint family
+    """
+    bucket = _rate_buckets.get(kind)
+    if bucket is None:
+        with _api_limits_lock:
+            bucket = _rate_buckets.get(kind)
+            if bucket is None:
+                bucket = TokenBucket(rate=OPENAI_REQUESTS_PER_SECOND)
+                _rate_buckets[kind] = bucket
+    return bucket
+
+# Separate concurrency limits for chat and embedding requests, so slow chat calls
+# cannot take every connection slot away from embedding calls (and vice versa)
+_request_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+def get_request_semaphore(kind: str) -> threading.BoundedSemaphore:
+    """
+    Get the concurrency limit for an OpenAI endpoint family.
+    
+    The limits come from MAX_CHAT_CONCURRENT and MAX_EMBEDDINGS_CONCURRENT (default 10 each;
+    values below 1 fall back to the default), as parsed by reload_config().
+    
+    Args:
+        kind: Endpoint family, either "chat" or "embeddings"
+        
+    Returns:
+        The shared semaphore for that endpoint family
+    """
+    semaphore = _request_semaphores.get(kind)
+    if semaphore is None:
+        with _api_limits_lock:
+            semaphore = _request_semaphores.get(kind)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS[kind])
+                _request_semaphores[kind] = semaphore
+    return semaphore
+
+@contextmanager
+def openai_request_slot(kind: str):
+    """
+    Hold a concurrency slot for an OpenAI endpoint family and wait for its rate limit.
+    
+    Args:
+        kind: Endpoint family, either "chat" or "embeddings"
+    """
+    with get_request_semaphore(kind):
+        get_rate_bucket(kind).acquire()
+        yield
+
+reload_config()
 
 def get_supabase_client() -> Client:
     """
@@ -29,56 +261,104 @@ def get_supabase_client() -> Client:
     
     return create_client(url, key)
 
+# Longest Retry-After wait honored before a retry, the same bound the OpenAI SDK applies
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+def _retry_delay(error: Exception, default: float) -> float:
+    """
+    Seconds to wait before retrying a failed OpenAI request, honoring the Retry-After
+    header of a rate limit response when it asks for a longer wait than the backoff.
+    The header is capped at MAX_RETRY_AFTER_SECONDS so one response can't park a
+    worker thread indefinitely.
+    """
+    if isinstance(error, openai.RateLimitError):
+        try:
+            retry_after = float(error.response.headers.get("retry-after", 0))
+        except (TypeError, ValueError):
+            return default
+        if retry_after != retry_after:  # NaN
+            return default
+        return max(default, min(retry_after, MAX_RETRY_AFTER_SECONDS))
+    return default
+
 def create_embeddings_batch(texts: List[str]) -> List[List[float]]:
     """
     Create embeddings for multiple texts in a single API call.
+    Duplicate texts are only sent once and share the same embedding.
     
     Args:
         texts: List of texts to create embeddings for
         
     Returns:
         List of embeddings (each embedding is a list of floats)
+        
+    Raises:
+        openai.AuthenticationError, openai.PermissionDeniedError: If the API key is rejected.
+            No text can be embedded then, so the error is raised instead of returning
+            zero vectors that would be stored as if the texts had been embedded.
     """
     if not texts:
         return []
     
+    # Crawled pages often repeat boilerplate chunks (navigation, footers), so embed
+    # each distinct text once and fan the results back out to every position
+    unique_texts = list(dict.fromkeys(texts))
+    if len(unique_texts) < len(texts):
+        text_to_embedding = dict(zip(unique_texts, create_embeddings_batch(unique_texts)))
+        return [text_to_embedding[text] for text in texts]
+    
     max_retries = 3
     retry_delay = 1.0  # Start with 1 second delay
     
     for retry in range(max_retries):
         try:
-            response = openai.embeddings.create(
-                model="text-embedding-3-small", # Hardcoding embedding model for now, will change this later to be more dynamic
-                input=texts
-            )
+            with openai_request_slot("embeddings"):
+                response = get_embedding_client().embeddings.create(
+                    model="text-embedding-3-small", # Hardcoding embedding model for now, will change this later to be more dynamic
+                    input=texts
+                )
             return [item.embedding for item in response.data]
+        except (openai.AuthenticationError, openai.PermissionDeniedError) as e:
+            # Rejected credentials fail the same way on every attempt and for every text
+            logger.error("Embedding request was not authorized: %s", e)
+            raise
         except Exception as e:
-            if retry < max_retries - 1:
-                print(f"Error creating batch embeddings (attempt {retry + 1}/{max_retries}): {e}")
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
+            # A rejected input won't be accepted on a retry, so go straight to the per-text fallback
+            if retry < max_retries - 1 and not isinstance(e, openai.BadRequestError):
+                delay = _retry_delay(e, retry_delay)
+                logger.warning("Error creating batch embeddings (attempt %d/%d): %s", retry + 1, max_retries, e)
+                logger.info("Retrying in %s seconds...", delay)
+                time.sleep(delay)
                 retry_delay *= 2  # Exponential backoff
             else:
-                print(f"Failed to create batch embeddings after {max_retries} attempts: {e}")
+                logger.error("Failed to create batch embeddings after %d attempts: %s", retry + 1, e)
+                if len(texts) == 1:
+                    # A single text (e.g. a query from create_embedding) was just tried on its own,
+                    # so retrying it individually would only repeat the failed request
+                    return [[0.0] * 1536]
+                
                 # Try creating embeddings one by one as fallback
-                print("Attempting to create embeddings individually...")
+                logger.info("Attempting to create embeddings individually...")
                 embeddings = []
                 successful_count = 0
                 
                 for i, text in enumerate(texts):
                     try:
-                        individual_response = openai.embeddings.create(
-                            model="text-embedding-3-small",
-                            input=[text]
-                        )
+                        with openai_request_slot("embeddings"):
+                            individual_response = get_embedding_client().embeddings.create(
+                                model="text-embedding-3-small",
+                                input=[text]
+                            )
                         embeddings.append(individual_response.data[0].embedding)
                         successful_count += 1
+                    except (openai.AuthenticationError, openai.PermissionDeniedError):
+                        raise
                     except Exception as individual_error:
-                        print(f"Failed to create embedding for text {i}: {individual_error}")
+                        logger.error("Failed to create embedding for text %d: %s", i, individual_error)
                         # Add zero embedding as fallback
                         embeddings.append([0.0] * 1536)
                 
-                print(f"Successfully created {successful_count}/{len(texts)} embeddings individually")
+                logger.info("Successfully created %d/%d embeddings individually", successful_count, len(texts))
                 return embeddings
 
 def create_embedding(text: str) -> List[float]:
@@ -95,14 +375,77 @@ def create_embedding(text: str) -> List[float]:
         embeddings = create_embeddings_batch([text])
         return embeddings[0] if embeddings else [0.0] * 1536
     except Exception as e:
-        print(f"Error creating embedding: {e}")
-        # Return empty embedding if there's an error
+        logger.error("Error creating embedding: %s", e)
+        # Return empty embedding if there's an error (including a rejected API key), so a
+        # search degrades to no vector matches instead of failing outright
         return [0.0] * 1536
 
+# Contexts generated by the LLM, keyed by model and document/chunk hashes, so re-crawling
+# unchanged pages doesn't pay for the same completions again. Least recently used
+# entries are evicted once the cache holds CONTEXTUAL_CACHE_SIZE items.
+_context_cache: "OrderedDict[Tuple[Optional[str], str, str], str]" = OrderedDict()
+_context_cache_lock = threading.Lock()
+
+def _context_cache_key(full_document: str, chunk: str) -> Tuple[Optional[str], str, str]:
+    document_hash = hashlib.sha256(full_document.encode("utf-8")).hexdigest()
+    chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    return MODEL_CHOICE, document_hash, chunk_hash
+
+def _get_cached_context(key: Tuple[Optional[str], str, str]) -> Optional[str]:
+    with _context_cache_lock:
+        context = _context_cache.get(key)
+        if context is not None:
+            _context_cache.move_to_end(key)
+        return context
+
+def _store_cached_context(key: Tuple[Optional[str], str, str], context: str) -> None:
+    max_size = CONTEXTUAL_CACHE_SIZE
+    if max_size <= 0:
+        return
+    with _context_cache_lock:
+        _context_cache[key] = context
+        _context_cache.move_to_end(key)
+        while len(_context_cache) > max_size:
+            _context_cache.popitem(last=False)
+
+# Characters of surrounding document sent on each side of a chunk when generating its context
+CONTEXT_WINDOW_CHARS = 4000
+# Windows start at multiples of this step and have a fixed length, so neighbouring chunks
+# of a long document are sent the same slice (and the same prompt prefix)
+CONTEXT_WINDOW_STEP = 2 * CONTEXT_WINDOW_CHARS
+CONTEXT_WINDOW_LENGTH = 6 * CONTEXT_WINDOW_CHARS
+
+def _document_window(full_document: str, chunk: str) -> str:
+    """
+    Return the part of the document sent to the LLM alongside a chunk.
+    
+    Documents up to CONTEXT_WINDOW_LENGTH characters are sent whole. For longer ones the
+    chunk is located in the document and a fixed-length slice is taken whose start is
+    snapped down to a multiple of CONTEXT_WINDOW_STEP. That keeps at least
+    CONTEXT_WINDOW_CHARS characters on each side of the chunk, while consecutive chunks
+    usually land on the same slice. If the chunk can't be found, the start of the
+    document is used instead.
+    """
+    if len(full_document) <= CONTEXT_WINDOW_LENGTH:
+        return full_document
+    
+    pos = full_document.find(chunk)
+    if pos == -1:
+        return full_document[:CONTEXT_WINDOW_LENGTH]
+    
+    start = max(0, (pos - CONTEXT_WINDOW_CHARS) // CONTEXT_WINDOW_STEP * CONTEXT_WINDOW_STEP)
+    # Only chunks longer than CONTEXT_WINDOW_STEP need the slice to be extended
+    end = max(start + CONTEXT_WINDOW_LENGTH, pos + len(chunk) + CONTEXT_WINDOW_CHARS)
+    return full_document[start:end]
+
 def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool]:
     """
     Generate contextual information for a chunk within a document to improve retrieval.
     
+    Only a window of the document around the chunk is sent to the LLM (see
+    _document_window), which assumes the chunk appears verbatim in the document,
+    as it does for chunks produced by smart_chunk_markdown.
+    
     Args:
         full_document: The complete document text
         chunk: The specific chunk of text to generate context for
@@ -112,32 +455,47 @@ def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str,
         - The contextual text that situates the chunk within the document
         - Boolean indicating if contextual embedding was performed
     """
-    model_choice = os.getenv("MODEL_CHOICE")
+    # A chunk that already makes up (nearly) the whole document has nothing to be situated in
+    if len(full_document) - len(chunk) < 500 and chunk.strip() in full_document:
+        return chunk, False
+    
+    document = _document_window(full_document, chunk)
+    cache_key = _context_cache_key(document, chunk)
+    context = _get_cached_context(cache_key)
+    if context is not None:
+        return f"{context}\n---\n{chunk}", True
     
     try:
+        # Keep the document in the system message and the chunk in the user message, so
+        # requests for chunks that share a document window start with an identical prefix
+        # that the provider's prompt cache can reuse
+        system_prompt = f"""You are a helpful assistant that provides concise contextual information.
+<document> 
+{document} 
+</document>"""
+        
         # Create the prompt for generating contextual information
-        prompt = f"""<document> 
-{full_document[:25000]} 
-</document>
-Here is the chunk we want to situate within the whole document 
+        prompt = f"""Here is the chunk we want to situate within the whole document 
 <chunk> 
 {chunk}
 </chunk> 
 Please give a short succinct context to situate this chunk within the overall document for the purposes of improving search retrieval of the chunk. Answer only with the succinct context and nothing else."""
 
         # Call the OpenAI API to generate contextual information
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides concise contextual information."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=200
-        )
+        with openai_request_slot("chat"):
+            response = openai.chat.completions.create(
+                model=MODEL_CHOICE,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=200
+            )
         
         # Extract the generated context
         context = response.choices[0].message.content.strip()
+        _store_cached_context(cache_key, context)
         
         # Combine the context with the original chunk
         contextual_text = f"{context}\n---\n{chunk}"
@@ -145,7 +503,7 @@ Please give a short succinct context to situate this chunk within the overall do
         return contextual_text, True
     
     except Exception as e:
-        print(f"Error generating contextual embedding: {e}. Using original chunk instead.")
+        logger.warning("Error generating contextual embedding: %s. Using original chunk instead.", e)
         return chunk, False
 
 def process_chunk_with_context(args):
@@ -164,6 +522,91 @@ def process_chunk_with_context(args):
     url, content, full_document = args
     return generate_contextual_embedding(full_document, content)
 
+def _source_ids_by_url(urls: List[str]) -> Dict[str, str]:
+    """
+    Map each distinct URL to its source ID (the domain, or the path for URLs without one).
+    """
+    source_ids = {}
+    for url in set(urls):
+        parsed_url = urlparse(url)
+        source_ids[url] = parsed_url.netloc or parsed_url.path
+    return source_ids
+
+def _insert_batch_with_retry(
+    client: Client,
+    table: str,
+    batch_data: List[Dict[str, Any]],
+    on_conflict: Optional[str] = None
+) -> None:
+    """
+    Insert a batch of records into a Supabase table, retrying with exponential backoff.
+    If every attempt fails, the records are inserted one at a time as a last resort.
+    
+    Args:
+        client: Supabase client
+        table: Name of the table to insert into
+        batch_data: Records to insert
+        on_conflict: Comma-separated unique columns; if given, records are upserted on them
+    """
+    def write(records):
+        if on_conflict:
+            return client.table(table).upsert(records, on_conflict=on_conflict).execute()
+        return client.table(table).insert(records).execute()
+    
+    max_retries = 3
+    retry_delay = 1.0  # Start with 1 second delay
+    
+    for retry in range(max_retries):
+        try:
+            write(batch_data)
+            # Success - break out of retry loop
+            break
+        except Exception as e:
+            if retry < max_retries - 1:
+                logger.warning("Error inserting batch into Supabase (attempt %d/%d): %s", retry + 1, max_retries, e)
+                logger.info("Retrying in %s seconds...", retry_delay)
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                # Final attempt failed
+                logger.error("Failed to insert batch after %d attempts: %s", max_retries, e)
+                # Optionally, try inserting records one by one as a last resort
+                logger.info("Attempting to insert records individually...")
+                successful_inserts = 0
+                for record in batch_data:
+                    try:
+                        write(record)
+                        successful_inserts += 1
+                    except Exception as individual_error:
+                        logger.error("Failed to insert individual record for URL %s: %s", record['url'], individual_error)
+                
+                if successful_inserts > 0:
+                    logger.info("Successfully inserted %d/%d records individually", successful_inserts, len(batch_data))
+
+def _delete_stale_chunks(client: Client, urls: List[str], chunk_numbers: List[int]) -> None:
+    """
+    Delete crawled_pages chunks numbered past the end of each URL's new chunk list.
+    URLs with the same chunk count are cleaned up together in a single request.
+    
+    Args:
+        client: Supabase client
+        urls: List of URLs that were just written
+        chunk_numbers: Chunk number of each written record
+    """
+    chunk_counts: Dict[str, int] = {}
+    for url, chunk_number in zip(urls, chunk_numbers):
+        chunk_counts[url] = max(chunk_counts.get(url, 0), chunk_number + 1)
+    
+    urls_by_count: Dict[int, List[str]] = {}
+    for url, count in chunk_counts.items():
+        urls_by_count.setdefault(count, []).append(url)
+    
+    for count, count_urls in urls_by_count.items():
+        try:
+            client.table("crawled_pages").delete().in_("url", count_urls).gte("chunk_number", count).execute()
+        except Exception as e:
+            logger.error("Error deleting stale chunks for %d URLs: %s", len(count_urls), e)
+
 def add_documents_to_supabase(
     client: Client, 
     urls: List[str], 
@@ -175,7 +618,8 @@ def add_documents_to_supabase(
 ) -> None:
     """
     Add documents to the Supabase crawled_pages table in batches.
-    Deletes existing records with the same URLs before inserting to prevent duplicates.
+    Records are upserted on (url, chunk_number), and chunks left over from a previous,
+    longer version of a page are deleted once all batches have been written.
     
     Args:
         client: Supabase client
@@ -186,133 +630,94 @@ def add_documents_to_supabase(
         url_to_full_document: Dictionary mapping URLs to their full document content
         batch_size: Size of each batch for insertion
     """
-    # Get unique URLs to delete existing records
-    unique_urls = list(set(urls))
-    
-    # Delete existing records for these URLs in a single operation
-    try:
-        if unique_urls:
-            # Use the .in_() filter to delete all records with matching URLs
-            client.table("crawled_pages").delete().in_("url", unique_urls).execute()
-    except Exception as e:
-        print(f"Batch delete failed: {e}. Trying one-by-one deletion as fallback.")
-        # Fallback: delete records one by one
-        for url in unique_urls:
-            try:
-                client.table("crawled_pages").delete().eq("url", url).execute()
-            except Exception as inner_e:
-                print(f"Error deleting record for URL {url}: {inner_e}")
-                # Continue with the next URL even if one fails
+    # Extract source_id from each distinct URL once instead of once per chunk
+    source_ids = _source_ids_by_url(urls)
     
     # Check if MODEL_CHOICE is set for contextual embeddings
-    use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
-    print(f"\n\nUse contextual embeddings: {use_contextual_embeddings}\n\n")
+    use_contextual_embeddings = USE_CONTEXTUAL_EMBEDDINGS
+    logger.info("Use contextual embeddings: %s", use_contextual_embeddings)
     
-    # Process in batches to avoid memory issues
-    for i in range(0, len(contents), batch_size):
-        batch_end = min(i + batch_size, len(contents))
-        
-        # Get batch slices
-        batch_urls = urls[i:batch_end]
-        batch_chunk_numbers = chunk_numbers[i:batch_end]
-        batch_contents = contents[i:batch_end]
-        batch_metadatas = metadatas[i:batch_end]
+    # Use one worker pool for the whole call instead of a new one per batch;
+    # its threads are only started once contextual embeddings submit work to it.
+    # Batches are written to Supabase on a second, smaller pool.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=SUPABASE_INSERT_CONCURRENCY) as insert_executor:
+        insert_futures = []
         
-        # Apply contextual embedding to each chunk if MODEL_CHOICE is set
+        # Submit the contextual LLM calls for every chunk up front so later batches are
+        # already being processed while earlier ones are embedded and inserted
+        context_futures = []
         if use_contextual_embeddings:
-            # Prepare arguments for parallel processing
-            process_args = []
-            for j, content in enumerate(batch_contents):
-                url = batch_urls[j]
-                full_document = url_to_full_document.get(url, "")
-                process_args.append((url, content, full_document))
+            context_futures = [
+                executor.submit(process_chunk_with_context, (url, content, url_to_full_document.get(url, "")))
+                for url, content in zip(urls, contents)
+            ]
+        
+        # Process in batches to avoid memory issues
+        for i in range(0, len(contents), batch_size):
+            batch_end = min(i + batch_size, len(contents))
             
-            # Process in parallel using ThreadPoolExecutor
-            contextual_contents = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                # Submit all tasks and collect results
-                future_to_idx = {executor.submit(process_chunk_with_context, arg): idx 
-                                for idx, arg in enumerate(process_args)}
-                
-                # Process results as they complete
-                for future in concurrent.futures.as_completed(future_to_idx):
-                    idx = future_to_idx[future]
+            # Get batch slices
+            batch_urls = urls[i:batch_end]
+            batch_chunk_numbers = chunk_numbers[i:batch_end]
+            batch_contents = contents[i:batch_end]
+            batch_metadatas = metadatas[i:batch_end]
+            
+            # Apply contextual embedding to each chunk if MODEL_CHOICE is set
+            if use_contextual_embeddings:
+                # Assign results by index so each one stays paired with its URL and metadata
+                contextual_contents = [None] * len(batch_contents)
+                for idx, future in enumerate(context_futures[i:batch_end]):
                     try:
                         result, success = future.result()
-                        contextual_contents.append(result)
+                        contextual_contents[idx] = result
                         if success:
                             batch_metadatas[idx]["contextual_embedding"] = True
                     except Exception as e:
-                        print(f"Error processing chunk {idx}: {e}")
+                        logger.error("Error processing chunk %d: %s", idx, e)
                         # Use original content as fallback
-                        contextual_contents.append(batch_contents[idx])
-            
-            # Sort results back into original order if needed
-            if len(contextual_contents) != len(batch_contents):
-                print(f"Warning: Expected {len(batch_contents)} results but got {len(contextual_contents)}")
-                # Use original contents as fallback
+                        contextual_contents[idx] = batch_contents[idx]
+            else:
+                # If not using contextual embeddings, use original contents
                 contextual_contents = batch_contents
-        else:
-            # If not using contextual embeddings, use original contents
-            contextual_contents = batch_contents
-        
-        # Create embeddings for the entire batch at once
-        batch_embeddings = create_embeddings_batch(contextual_contents)
-        
-        batch_data = []
-        for j in range(len(contextual_contents)):
-            # Extract metadata fields
-            chunk_size = len(contextual_contents[j])
             
-            # Extract source_id from URL
-            parsed_url = urlparse(batch_urls[j])
-            source_id = parsed_url.netloc or parsed_url.path
+            # Create embeddings for the entire batch at once
+            batch_embeddings = create_embeddings_batch(contextual_contents)
             
-            # Prepare data for insertion
-            data = {
-                "url": batch_urls[j],
-                "chunk_number": batch_chunk_numbers[j],
-                "content": contextual_contents[j],  # Store original content
-                "metadata": {
-                    "chunk_size": chunk_size,
-                    **batch_metadatas[j]
-                },
-                "source_id": source_id,  # Add source_id field
-                "embedding": batch_embeddings[j]  # Use embedding from contextual content
-            }
+            batch_data = []
+            for j in range(len(contextual_contents)):
+                # Extract metadata fields
+                chunk_size = len(contextual_contents[j])
+                
+                source_id = source_ids[batch_urls[j]]
+                
+                # Prepare data for insertion
+                data = {
+                    "url": batch_urls[j],
+                    "chunk_number": batch_chunk_numbers[j],
+                    "content": contextual_contents[j],  # Store original content
+                    "metadata": {
+                        "chunk_size": chunk_size,
+                        **batch_metadatas[j]
+                    },
+                    "source_id": source_id,  # Add source_id field
+                    "embedding": batch_embeddings[j]  # Use embedding from contextual content
+                }
+                
+                batch_data.append(data)
             
-            batch_data.append(data)
-        
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
+            # Insert in the background so the next batch is embedded while this one is written
+            insert_futures.append(
+                insert_executor.submit(
+                    _insert_batch_with_retry, client, "crawled_pages", batch_data, "url,chunk_number"
+                )
+            )
         
-        for retry in range(max_retries):
-            try:
-                client.table("crawled_pages").insert(batch_data).execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            client.table("crawled_pages").insert(record).execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-                    
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
+        # Wait for all outstanding inserts before cleaning up
+        for future in insert_futures:
+            future.result()
+    
+    _delete_stale_chunks(client, urls, chunk_numbers)
 
 def search_documents(
     client: Client, 
@@ -351,10 +756,13 @@ def search_documents(
         
         return result.data
     except Exception as e:
-        print(f"Error searching documents: {e}")
+        logger.error("Error searching documents: %s", e)
         return []
 
 
+# A fenced code block: an opening ``` up to the next ``` (the language line is part of group 1)
+_CODE_BLOCK_PATTERN = re.compile(r'```(.*?)```', re.DOTALL)
+
 def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[Dict[str, Any]]:
     """
     Extract code blocks from markdown content along with context.
@@ -374,45 +782,30 @@ def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[D
     if content.startswith('```'):
         # Skip the first triple backticks
         start_offset = 3
-        print("Skipping initial triple backticks")
-    
-    # Find all occurrences of triple backticks
-    backtick_positions = []
-    pos = start_offset
-    while True:
-        pos = markdown_content.find('```', pos)
-        if pos == -1:
-            break
-        backtick_positions.append(pos)
-        pos += 3
+        logger.debug("Skipping initial triple backticks")
     
-    # Process pairs of backticks
-    i = 0
-    while i < len(backtick_positions) - 1:
-        start_pos = backtick_positions[i]
-        end_pos = backtick_positions[i + 1]
+    # Pair up triple backticks in a single regex pass; each match runs from an opening fence
+    # to the next closing fence, exactly like pairing consecutive backtick positions
+    for match in _CODE_BLOCK_PATTERN.finditer(markdown_content, start_offset):
+        start_pos = match.start()
+        end_pos = match.end() - 3
         
         # Extract the content between backticks
-        code_section = markdown_content[start_pos+3:end_pos]
+        code_section = match.group(1)
         
         # Check if there's a language specifier on the first line
-        lines = code_section.split('\n', 1)
-        if len(lines) > 1:
-            # Check if first line is a language specifier (no spaces, common language names)
-            first_line = lines[0].strip()
-            if first_line and not ' ' in first_line and len(first_line) < 20:
-                language = first_line
-                code_content = lines[1].strip() if len(lines) > 1 else ""
-            else:
-                language = ""
-                code_content = code_section.strip()
+        first_line, newline, rest = code_section.partition('\n')
+        first_line = first_line.strip()
+        if newline and first_line and not ' ' in first_line and len(first_line) < 20:
+            # First line is a language specifier (no spaces, common language names)
+            language = first_line
+            code_content = rest.strip()
         else:
             language = ""
             code_content = code_section.strip()
         
         # Skip if code block is too short
         if len(code_content) < min_length:
-            i += 2  # Move to next pair
             continue
         
         # Extract context before (1000 chars)
@@ -427,16 +820,18 @@ def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[D
             'code': code_content,
             'language': language,
             'context_before': context_before,
-            'context_after': context_after,
-            'full_context': f"{context_before}\n\n{code_content}\n\n{context_after}"
+            'context_after': context_after
         })
-        
-        # Move to next pair (skip the closing backtick we just processed)
-        i += 2
     
     return code_blocks
 
 
+# The system message is the same for every code example, so it is built once
+CODE_SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a helpful assistant that provides concise code example summaries."
+}
+
 def generate_code_example_summary(code: str, context_before: str, context_after: str) -> str:
     """
     Generate a summary for a code example using its surrounding context.
@@ -449,8 +844,6 @@ def generate_code_example_summary(code: str, context_before: str, context_after:
     Returns:
         A summary of what the code example demonstrates
     """
-    model_choice = os.getenv("MODEL_CHOICE")
-    
     # Create the prompt
     prompt = f"""<context_before>
 {context_before[-500:] if len(context_before) > 500 else context_before}
@@ -468,20 +861,21 @@ Based on the code example and its surrounding context, provide a concise summary
 """
     
     try:
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides concise code example summaries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=100
-        )
+        with openai_request_slot("chat"):
+            response = openai.chat.completions.create(
+                model=MODEL_CHOICE,
+                messages=[
+                    CODE_SUMMARY_SYSTEM_MESSAGE,
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=100
+            )
         
         return response.choices[0].message.content.strip()
     
     except Exception as e:
-        print(f"Error generating code example summary: {e}")
+        logger.warning("Error generating code example summary: %s", e)
         return "Code example for demonstration purposes."
 
 
@@ -509,89 +903,78 @@ def add_code_examples_to_supabase(
     if not urls:
         return
         
-    # Delete existing records for these URLs
+    # Delete existing records for these URLs in a single operation
     unique_urls = list(set(urls))
-    for url in unique_urls:
-        try:
-            client.table('code_examples').delete().eq('url', url).execute()
-        except Exception as e:
-            print(f"Error deleting existing code examples for {url}: {e}")
-    
-    # Process in batches
-    total_items = len(urls)
-    for i in range(0, total_items, batch_size):
-        batch_end = min(i + batch_size, total_items)
-        batch_texts = []
-        
-        # Create combined texts for embedding (code + summary)
-        for j in range(i, batch_end):
-            combined_text = f"{code_examples[j]}\n\nSummary: {summaries[j]}"
-            batch_texts.append(combined_text)
-        
-        # Create embeddings for the batch
-        embeddings = create_embeddings_batch(batch_texts)
-        
-        # Check if embeddings are valid (not all zeros)
-        valid_embeddings = []
-        for embedding in embeddings:
-            if embedding and not all(v == 0.0 for v in embedding):
-                valid_embeddings.append(embedding)
-            else:
-                print(f"Warning: Zero or invalid embedding detected, creating new one...")
-                # Try to create a single embedding as fallback
-                single_embedding = create_embedding(batch_texts[len(valid_embeddings)])
-                valid_embeddings.append(single_embedding)
-        
-        # Prepare batch data
-        batch_data = []
-        for j, embedding in enumerate(valid_embeddings):
-            idx = i + j
+    try:
+        client.table('code_examples').delete().in_('url', unique_urls).execute()
+    except Exception as e:
+        logger.warning("Batch delete of code examples failed: %s. Trying one-by-one deletion as fallback.", e)
+        # Fallback: delete records one by one
+        for url in unique_urls:
+            try:
+                client.table('code_examples').delete().eq('url', url).execute()
+            except Exception as inner_e:
+                logger.error("Error deleting existing code examples for %s: %s", url, inner_e)
+    
+    # Extract source_id from each distinct URL once instead of once per code example
+    source_ids = _source_ids_by_url(urls)
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SUPABASE_INSERT_CONCURRENCY) as insert_executor:
+        insert_futures = []
+        
+        # Process in batches
+        total_items = len(urls)
+        for i in range(0, total_items, batch_size):
+            batch_end = min(i + batch_size, total_items)
+            batch_texts = []
             
-            # Extract source_id from URL
-            parsed_url = urlparse(urls[idx])
-            source_id = parsed_url.netloc or parsed_url.path
+            # Create combined texts for embedding (code + summary)
+            for j in range(i, batch_end):
+                combined_text = f"{code_examples[j]}\n\nSummary: {summaries[j]}"
+                batch_texts.append(combined_text)
             
-            batch_data.append({
-                'url': urls[idx],
-                'chunk_number': chunk_numbers[idx],
-                'content': code_examples[idx],
-                'summary': summaries[idx],
-                'metadata': metadatas[idx],  # Store as JSON object, not string
-                'source_id': source_id,
-                'embedding': embedding
-            })
-        
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
+            # Create embeddings for the batch
+            embeddings = create_embeddings_batch(batch_texts)
+            
+            # Check if embeddings are valid (not all zeros); any() stops at the first
+            # non-zero value, which for a real embedding is almost always the first one
+            valid_embeddings = list(embeddings)
+            invalid_indices = [k for k, embedding in enumerate(valid_embeddings) if not any(embedding)]
+
+            if invalid_indices:
+                logger.warning("%d zero or invalid embeddings detected, creating new ones...", len(invalid_indices))
+                # Retry all invalid texts together in a single request instead of one request per text
+                retry_embeddings = create_embeddings_batch([batch_texts[k] for k in invalid_indices])
+                for k, embedding in zip(invalid_indices, retry_embeddings):
+                    valid_embeddings[k] = embedding
+            
+            # Prepare batch data
+            batch_data = []
+            for j, embedding in enumerate(valid_embeddings):
+                idx = i + j
+                
+                source_id = source_ids[urls[idx]]
+                
+                batch_data.append({
+                    'url': urls[idx],
+                    'chunk_number': chunk_numbers[idx],
+                    'content': code_examples[idx],
+                    'summary': summaries[idx],
+                    'metadata': metadatas[idx],  # Store as JSON object, not string
+                    'source_id': source_id,
+                    'embedding': embedding
+                })
+            
+            # Insert in the background so the next batch is embedded while this one is written
+            insert_futures.append(
+                insert_executor.submit(_insert_batch_with_retry, client, 'code_examples', batch_data)
+            )
         
-        for retry in range(max_retries):
-            try:
-                client.table('code_examples').insert(batch_data).execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            client.table('code_examples').insert(record).execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-                    
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
-        print(f"Inserted batch {i//batch_size + 1} of {(total_items + batch_size - 1)//batch_size} code examples")
+        # Wait for all outstanding inserts before returning
+        total_batches = (total_items + batch_size - 1) // batch_size
+        for batch_number, future in enumerate(insert_futures, 1):
+            future.result()
+            logger.info("Inserted batch %d of %d code examples", batch_number, total_batches)
 
 
 def update_source_info(client: Client, source_id: str, summary: str, word_count: int):
@@ -619,13 +1002,19 @@ def update_source_info(client: Client, source_id: str, summary: str, word_count:
                 'summary': summary,
                 'total_word_count': word_count
             }).execute()
-            print(f"Created new source: {source_id}")
+            logger.info("Created new source: %s", source_id)
         else:
-            print(f"Updated source: {source_id}")
+            logger.info("Updated source: %s", source_id)
             
     except Exception as e:
-        print(f"Error updating source {source_id}: {e}")
+        logger.error("Error updating source %s: %s", source_id, e)
+
 
+# The system message is the same for every source, so it is built once
+SOURCE_SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a helpful assistant that provides concise library/tool/framework summaries."
+}
 
 def extract_source_summary(source_id: str, content: str, max_length: int = 500) -> str:
     """
@@ -647,9 +1036,6 @@ def extract_source_summary(source_id: str, content: str, max_length: int = 500)
     if not content or len(content.strip()) == 0:
         return default_summary
     
-    # Get the model choice from environment variables
-    model_choice = os.getenv("MODEL_CHOICE")
-    
     # Limit content length to avoid token limits
     truncated_content = content[:25000] if len(content) > 25000 else content
     
@@ -663,15 +1049,16 @@ The above content is from the documentation for '{source_id}'. Please provide a
     
     try:
         # Call the OpenAI API to generate the summary
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides concise library/tool/framework summaries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=150
-        )
+        with openai_request_slot("chat"):
+            response = openai.chat.completions.create(
+                model=MODEL_CHOICE,
+                messages=[
+                    SOURCE_SUMMARY_SYSTEM_MESSAGE,
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=150
+            )
         
         # Extract the generated summary
         summary = response.choices[0].message.content.strip()
@@ -683,7 +1070,7 @@ The above content is from the documentation for '{source_id}'. Please provide a
         return summary
     
     except Exception as e:
-        print(f"Error generating summary with LLM for {source_id}: {e}. Using default summary.")
+        logger.warning("Error generating summary with LLM for %s: %s. Using default summary.", source_id, e)
         return default_summary
 
 
@@ -734,5 +1121,5 @@ def search_code_examples(
         
         return result.data
     except Exception as e:
-        print(f"Error searching code examples: {e}")
+        logger.error("Error searching code examples: %s", e)
         return []
\ No newline at end of file